@@ -1,15 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g
+from flask.sessions import SecureCookieSessionInterface
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+import numpy as np
+import orjson
 import sqlite3
 import os
-import random
+import atexit
+import collections
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
 
 # =====================================================
 # Environment Configuration
 # =====================================================
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 DATABASE_PATH = os.getenv("DATABASE_PATH", "smart_tiles.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "0.1"))
+FLUSH_BATCH = int(os.getenv("FLUSH_BATCH", "64"))
+FLUSH_MAX = int(os.getenv("FLUSH_MAX", "500"))
+REDIS_URL = os.getenv("REDIS_URL")
 
 # =====================================================
 # Flask App Setup
@@ -18,33 +36,247 @@ app = Flask(__name__)
 app.secret_key = SECRET_KEY
 CORS(app)
 
+# Verified session contents keyed by the raw cookie value. A signed cookie
+# can't be edited in place, so a login or logout produces a new key.
+_session_cache = TTLCache(maxsize=4096, ttl=60)
+_session_cache_lock = threading.Lock()
+
+class StaticSkippingSessionInterface(SecureCookieSessionInterface):
+    """Signed-cookie sessions that are never decoded for static files.
+
+    Flask opens the session before routing, so without this every CSS/JS
+    request from a logged-in browser pays for an HMAC check it never uses.
+    Other requests verify a given cookie once and reuse the result.
+    """
+
+    def open_session(self, app, request):
+        if request.path.startswith(app.static_url_path + "/"):
+            return self.session_class()
+        raw = request.cookies.get(self.get_cookie_name(app))
+        if raw:
+            with _session_cache_lock:
+                data = _session_cache.get(raw)
+            if data is not None:
+                return self.session_class(data)
+
+        session = super().open_session(app, request)
+        # Flash lists are mutated in place, so only flat sessions are shared
+        if raw and session and '_flashes' not in session:
+            with _session_cache_lock:
+                _session_cache[raw] = dict(session)
+        return session
+
+# Keep sessions server-side when Redis is available; the cookie then only
+# carries a session id. Without REDIS_URL signed cookies are used.
+if REDIS_URL:
+    import redis
+    from flask_session import Session
+
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.Redis.from_url(REDIS_URL)
+    Session(app)
+else:
+    app.session_interface = StaticSkippingSessionInterface()
+
 # =====================================================
 # Database Utilities
 # =====================================================
-def get_db():
-    conn = sqlite3.connect(DATABASE_PATH)
+# Connections are opened lazily and kept for the life of the process, so
+# requests no longer pay for reopening the database file on every call.
+_pool = queue.Queue(maxsize=DB_POOL_SIZE)
+
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA journal_size_limit=67108864;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA foreign_keys=ON;
+    PRAGMA secure_delete=OFF;
+"""
+
+# Statements live in constants so each pooled connection's statement
+# cache keeps them prepared between requests.
+SQL_NEXT_STEP = """
+    UPDATE users SET step_count=step_count+1 WHERE id=? RETURNING step_count, clear_epoch
+"""
+# A whole batch of footsteps is bound as one JSON array parameter and
+# expanded by SQLite, instead of binding six parameters per row. The join
+# on users skips steps whose user was deleted, or whose history was cleared
+# (clear_epoch moved on), since they were queued, whichever worker queued
+# them; such rows are dropped instead of failing the whole batch.
+SQL_INSERT_STEPS = """
+    INSERT INTO energy_data (user_id, footsteps, force, displacement, energy_generated)
+    SELECT u.id, json_extract(j.value, '$[1]'),
+           json_extract(j.value, '$[2]'), json_extract(j.value, '$[3]'),
+           json_extract(j.value, '$[4]')
+    FROM json_each(?) j
+    JOIN users u ON u.id = json_extract(j.value, '$[0]')
+                AND u.clear_epoch = json_extract(j.value, '$[5]')
+"""
+SQL_ADD_STATS = """
+    INSERT INTO user_stats (user_id, total_steps, total_energy)
+    SELECT u.id, COUNT(*), SUM(json_extract(j.value, '$[4]'))
+    FROM json_each(?) j
+    JOIN users u ON u.id = json_extract(j.value, '$[0]')
+                AND u.clear_epoch = json_extract(j.value, '$[5]')
+    GROUP BY 1
+    ON CONFLICT(user_id) DO UPDATE SET
+        total_steps = total_steps + excluded.total_steps,
+        total_energy = total_energy + excluded.total_energy
+"""
+# Each arm is a unique-index seek, and LIMIT 1 skips the email seek (and
+# the rowid de-duplication an OR needs) whenever the username matches.
+SQL_SELECT_USER_BY_LOGIN = """
+    SELECT * FROM users WHERE username=?
+    UNION ALL
+    SELECT * FROM users WHERE email=?
+    LIMIT 1
+"""
+SQL_UPDATE_LAST_LOGIN = "UPDATE users SET last_login=? WHERE id=?"
+SQL_UPDATE_PASSWORD_HASH = "UPDATE users SET password_hash=? WHERE id=?"
+SQL_INSERT_USER = "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)"
+SQL_UPDATE_PROFILE = "UPDATE users SET username=?, email=? WHERE id=?"
+# Profile fields and lifetime totals in one round trip; the stats row is a
+# primary-key seek on user_stats and may not exist yet.
+SQL_SELECT_PROFILE = """
+    SELECT u.username, u.email, date(u.created_at) AS created_on, u.last_login,
+           COALESCE(s.total_steps, 0) AS total_steps,
+           COALESCE(s.total_energy, 0) AS total_energy
+    FROM users u LEFT JOIN user_stats s ON s.user_id = u.id
+    WHERE u.id=?
+"""
+# The lifetime totals ride along on every recent row (one primary-key seek
+# each), so the dashboard needs a single statement. Rows at or below the
+# user's clear_cutoff belong to a cleared history that hasn't been swept yet.
+SQL_SELECT_RECENT_STEPS = """
+    SELECT e.footsteps AS step,
+           ROUND(e.force, 2) AS force,
+           ROUND(e.displacement * 1000, 3) AS displacement,
+           ROUND(e.energy_generated * 1000, 2) AS energy,
+           COALESCE(s.total_steps, 0) AS total_steps,
+           COALESCE(s.total_energy, 0) AS total_energy
+    FROM energy_data e
+    JOIN users u ON u.id = e.user_id
+    LEFT JOIN user_stats s ON s.user_id = e.user_id
+    WHERE e.user_id=? AND e.id > u.clear_cutoff
+    ORDER BY e.footsteps DESC
+    LIMIT 10
+"""
+# A clear hides the user's history at once by recording the highest step id
+# as clear_cutoff; the rows are then deleted in bounded chunks so one large
+# history doesn't hold the write lock, and a sweep that fails is retried.
+SQL_DELETE_STEPS_CHUNK = """
+    DELETE FROM energy_data WHERE id IN (
+        SELECT e.id FROM energy_data e JOIN users u ON u.id = e.user_id
+        WHERE e.user_id=? AND e.id <= u.clear_cutoff LIMIT ?
+    )
+"""
+DELETE_CHUNK = 5000
+SQL_DELETE_STATS = "DELETE FROM user_stats WHERE user_id=?"
+# Moving clear_epoch on invalidates steps still buffered in any worker.
+SQL_RESET_STEP_COUNT = """
+    UPDATE users SET step_count=0, clear_epoch=clear_epoch+1,
+        clear_cutoff=(SELECT COALESCE(MAX(id), 0) FROM energy_data)
+    WHERE id=?
+"""
+
+def _connect():
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=256
+    )
     conn.row_factory = sqlite3.Row
+    conn.executescript(CONNECTION_PRAGMAS)
     return conn
 
-def init_db():
-    conn = get_db()
-    cursor = conn.cursor()
+def _acquire():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+def _release(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def db():
+    """Borrow a pooled connection for work done outside a request."""
+    conn = _acquire()
+    try:
+        yield conn
+    finally:
+        _release(conn)
+
+def get_db():
+    """Return the request's pooled connection, checking one out if needed."""
+    conn = g.get("_db")
+    if conn is None:
+        conn = g._db = _acquire()
+    return conn
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("_db", None)
+    if conn is not None:
+        _release(conn)
+
+# Bump whenever init_db gains a new table, index or migration step.
+SCHEMA_VERSION = 3
+
+def init_db(force=False):
+    conn = sqlite3.connect(DATABASE_PATH, isolation_level=None)
+
+    # A worker that finds the schema current only reads the file header and
+    # never takes the write lock.
+    if not force and conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
+
+    # page_size is fixed once the first page is written, so it has to be
+    # set on a brand-new file before WAL mode or any table is created.
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute("PRAGMA page_size=4096")
+    conn.executescript(CONNECTION_PRAGMAS)
+
+    # Workers that raced past the check above queue on the write lock; the
+    # DDL below is idempotent, so the losers just find nothing to do.
+    conn.execute("BEGIN IMMEDIATE")
 
-    cursor.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
+            last_login TIMESTAMP,
+            step_count INTEGER NOT NULL DEFAULT 0,
+            clear_epoch INTEGER NOT NULL DEFAULT 0,
+            clear_cutoff INTEGER NOT NULL DEFAULT 0
         )
     """)
 
-    cursor.execute("""
+    # energy_data used to be created without a foreign key; move such a
+    # table aside so it is rebuilt below with ON DELETE CASCADE.
+    legacy_energy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='energy_data'"
+    ).fetchone() and not conn.execute("PRAGMA foreign_key_list(energy_data)").fetchall()
+    if legacy_energy:
+        conn.execute("ALTER TABLE energy_data RENAME TO energy_data_old")
+
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS energy_data (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             footsteps INTEGER NOT NULL,
             force REAL NOT NULL,
@@ -53,11 +285,315 @@ def init_db():
         )
     """)
 
-    conn.commit()
+    if legacy_energy:
+        conn.execute("""
+            INSERT INTO energy_data
+            SELECT * FROM energy_data_old WHERE user_id IN (SELECT id FROM users)
+        """)
+        conn.execute("DROP TABLE energy_data_old")
+
+    # Running totals per user, kept in step with energy_data by the write
+    # buffer so dashboard polls don't re-aggregate the whole history.
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_stats'"
+    ).fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            total_steps INTEGER NOT NULL DEFAULT 0,
+            total_energy REAL NOT NULL DEFAULT 0
+        )
+    """)
+    if not has_stats:
+        conn.execute("""
+            INSERT INTO user_stats (user_id, total_steps, total_energy)
+            SELECT user_id, COUNT(*), SUM(energy_generated)
+            FROM energy_data GROUP BY user_id
+        """)
+
+    # Serves every per-user energy_data query: the recent-steps listing
+    # reads it backwards and stops after ten entries.
+    has_step_index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_energy_user_step'"
+    ).fetchone()
+    if not has_step_index:
+        conn.execute("CREATE INDEX idx_energy_user_step ON energy_data(user_id, footsteps DESC)")
+        conn.execute("ANALYZE")
+
+    # Databases created before users.step_count existed get the column
+    # added and seeded from their current footstep history.
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    if "step_count" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN step_count INTEGER NOT NULL DEFAULT 0")
+        conn.execute("""
+            UPDATE users SET step_count = (
+                SELECT COALESCE(MAX(footsteps),0) FROM energy_data WHERE user_id=users.id
+            )
+        """)
+    if "clear_epoch" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN clear_epoch INTEGER NOT NULL DEFAULT 0")
+    if "clear_cutoff" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN clear_cutoff INTEGER NOT NULL DEFAULT 0")
+
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    conn.execute("COMMIT")
     conn.close()
     print("✅ Database initialized")
 
-init_db()
+@app.cli.command("init-db")
+def init_db_command():
+    """Create or migrate the database schema."""
+    init_db(force=True)
+
+init_db(force=bool(os.getenv("FORCE_INIT_DB")))
+
+# =====================================================
+# Write Buffer
+# =====================================================
+# Simulated footsteps and last-login stamps are queued in memory and
+# written in batches by a background thread, every FLUSH_INTERVAL seconds
+# or as soon as FLUSH_BATCH steps are waiting, so a burst of requests
+# costs one transaction instead of one commit each. A backlog is written
+# FLUSH_MAX steps per transaction so the write lock is never held for long.
+# Readers flush first, so a user sees the steps buffered by the worker that
+# serves the read; steps buffered by another worker process land within
+# FLUSH_INTERVAL.
+_pending = collections.deque()
+_pending_logins = {}
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_flusher = None
+_unswept = set()
+
+# The dashboard polls /get-energy-data, so payloads are cached briefly. The
+# key includes a per-user version bumped on every write in this process, so
+# a user's own steps show up immediately; writes made by other workers
+# appear once the entry expires.
+_energy_cache = TTLCache(maxsize=1024, ttl=1)
+_energy_cache_lock = threading.Lock()
+_user_version = collections.defaultdict(int)
+
+def _start_flusher():
+    # Called with _pending_lock held
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, name="write-flusher", daemon=True)
+        _flusher.start()
+
+def queue_step(conn, user_id, force, displacement, energy_j):
+    """Allocate the user's next step number and buffer the reading.
+
+    Returns the step number, or None if the user no longer exists.
+    """
+    # The UPDATE may wait on another process's write lock, so it runs before
+    # taking _pending_lock; queue order doesn't matter to the batch insert.
+    row = conn.execute(SQL_NEXT_STEP, (user_id,)).fetchone()
+    if row is None:
+        return None
+    step, epoch = row
+    with _pending_lock:
+        _pending.append((user_id, step, force, displacement, energy_j, epoch))
+        if len(_pending) >= FLUSH_BATCH:
+            _flush_wanted.set()
+        _start_flusher()
+    _bump_version(user_id)
+    return step
+
+def _bump_version(user_id):
+    """Retire the user's cached dashboard payload in this process."""
+    with _pending_lock:
+        _user_version[user_id] += 1
+
+def queue_login(user_id):
+    """Buffer a last_login update, stamped in the format CURRENT_TIMESTAMP uses."""
+    with _pending_lock:
+        _pending_logins[user_id] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        _start_flusher()
+
+def flush_pending():
+    """Write all buffered footsteps and logins."""
+    with _flush_lock:
+        while _write_batch():
+            pass
+
+def _write_batch():
+    # Called with _flush_lock held; returns False once nothing is queued
+    with _pending_lock:
+        if not _pending and not _pending_logins:
+            return False
+        rows = [_pending.popleft() for _ in range(min(len(_pending), FLUSH_MAX))]
+        logins = [(stamp, user_id) for user_id, stamp in _pending_logins.items()]
+        _pending_logins.clear()
+
+    with db() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if rows:
+                payload = json.dumps(rows)
+                conn.execute(SQL_INSERT_STEPS, (payload,))
+                conn.execute(SQL_ADD_STATS, (payload,))
+            if logins:
+                conn.executemany(SQL_UPDATE_LAST_LOGIN, logins)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            # Login stamps are always retried; footsteps that violate a
+            # constraint would fail the same way again, so only those are
+            # dropped.
+            with _pending_lock:
+                if not isinstance(e, sqlite3.IntegrityError):
+                    _pending.extendleft(reversed(rows))
+                for stamp, user_id in logins:
+                    _pending_logins.setdefault(user_id, stamp)
+            raise
+    return True
+
+def _flush_loop():
+    while True:
+        _flush_wanted.wait(FLUSH_INTERVAL)
+        _flush_wanted.clear()
+        try:
+            flush_pending()
+        except sqlite3.Error as e:
+            print(f"❌ Failed to flush pending writes: {e}")
+        _retry_sweeps()
+
+atexit.register(flush_pending)
+
+def sweep_cleared(conn, user_id):
+    """Delete the steps hidden by the user's last clear, a chunk at a time.
+
+    Each chunk commits on its own, letting other writers and the WAL
+    checkpoint in between. If a chunk fails the user is handed to the
+    flusher, which tries again on its next pass.
+    """
+    try:
+        while conn.execute(SQL_DELETE_STEPS_CHUNK, (user_id, DELETE_CHUNK)).rowcount:
+            pass
+    except sqlite3.Error as e:
+        print(f"❌ Failed to delete cleared steps: {e}")
+        with _pending_lock:
+            _unswept.add(user_id)
+            _start_flusher()
+
+def _retry_sweeps():
+    with _pending_lock:
+        users = list(_unswept)
+        _unswept.clear()
+    for user_id in users:
+        with db() as conn:
+            sweep_cleared(conn, user_id)
+
+def flush_before_read():
+    """Flush so the reader sees its buffered writes, without failing the read.
+
+    Anything that couldn't be written stays queued for the flusher to retry;
+    the read then shows what is already committed.
+    """
+    try:
+        flush_pending()
+    except sqlite3.Error as e:
+        print(f"❌ Failed to flush pending writes: {e}")
+
+# =====================================================
+# JSON Responses
+# =====================================================
+def json_response(payload, status=200):
+    """Serialize with orjson; cheaper than Flask's jsonify."""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype="application/json")
+
+# =====================================================
+# Footstep Simulation
+# =====================================================
+# Readings are drawn from NumPy in batches and handed out one at a time,
+# instead of two Python-level random.uniform() calls and a multiply per
+# request. Each thread keeps its own generator and buffer (a Generator is
+# not thread-safe), so handing out a reading takes no lock.
+SAMPLE_BATCH = 1024
+_sample_state = threading.local()
+
+def generate_samples(rng, n):
+    """Draw n simulated (force, displacement, energy) readings."""
+    forces = rng.uniform(400, 800, n)
+    displacements = rng.uniform(0.002, 0.005, n)
+    energies = forces * displacements
+    return zip(forces.tolist(), displacements.tolist(), energies.tolist())
+
+def draw_sample():
+    """Return one simulated (force, displacement, energy) reading."""
+    samples = getattr(_sample_state, "samples", None)
+    if samples is None:
+        _sample_state.rng = np.random.default_rng()
+        samples = _sample_state.samples = []
+    if not samples:
+        samples.extend(generate_samples(_sample_state.rng, SAMPLE_BATCH))
+    return samples.pop()
+
+# =====================================================
+# Password Hashing
+# =====================================================
+# argon2id runs in native code; the old Werkzeug pbkdf2 hashes are still
+# accepted and upgraded the next time their owner signs in. The cost is
+# OWASP's recommended baseline (19 MiB, 2 passes).
+_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+def hash_password(password):
+    return _hasher.hash(password)
+
+def verify_password(stored_hash, password):
+    if not stored_hash.startswith("$argon2"):
+        return check_password_hash(stored_hash, password)
+    try:
+        return _hasher.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def needs_rehash(stored_hash):
+    return not stored_hash.startswith("$argon2") or _hasher.check_needs_rehash(stored_hash)
+
+# =====================================================
+# Page Cache
+# =====================================================
+# The login and register pages are identical for every visitor unless a
+# flash message is waiting, so the rendered HTML is kept per process.
+_page_cache = {}
+
+def render_cached(template):
+    if '_flashes' in session or app.jinja_env.auto_reload:
+        return render_template(template)
+    html = _page_cache.get(template)
+    if html is None:
+        html = _page_cache[template] = render_template(template)
+    return html
+
+# =====================================================
+# Auth Helpers
+# =====================================================
+# Protected views read the user id once here and use g.uid afterwards;
+# public pages never touch it.
+def require_auth(view):
+    """Send anonymous visitors to the login page."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        uid = session.get('user_id')
+        if uid is None:
+            return redirect(url_for('login'))
+        g.uid = uid
+        return view(*args, **kwargs)
+    return wrapped
+
+def require_api_auth(view):
+    """Reject anonymous API calls with a 401."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        uid = session.get('user_id')
+        if uid is None:
+            return json_response({'success': False}, 401)
+        g.uid = uid
+        return view(*args, **kwargs)
+    return wrapped
 
 # =====================================================
 # Auth Routes
@@ -78,29 +614,23 @@ def register():
             flash("Invalid input", "error")
             return render_template('register.html')
 
+        # Hash before checking out a connection so the pool isn't held
+        # for the duration of the KDF.
+        password_hash = hash_password(password)
         conn = get_db()
-        cursor = conn.cursor()
 
-        cursor.execute(
-            "SELECT id FROM users WHERE username=? OR email=?",
-            (username, email)
-        )
-        if cursor.fetchone():
-            conn.close()
-            flash("Username or email already exists", "error")
+        # The UNIQUE constraints do the existence check in the same statement.
+        try:
+            conn.execute(SQL_INSERT_USER, (username, email, password_hash))
+        except sqlite3.IntegrityError as e:
+            taken = "Email" if "users.email" in str(e) else "Username"
+            flash(f"{taken} already exists", "error")
             return render_template('register.html')
 
-        cursor.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
-            (username, email, generate_password_hash(password))
-        )
-        conn.commit()
-        conn.close()
-
         flash("Registration successful", "success")
         return redirect(url_for('login'))
 
-    return render_template('register.html')
+    return render_cached('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -109,29 +639,20 @@ def login():
         password = request.form.get('password')
 
         conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * FROM users WHERE username=? OR email=?",
-            (identifier, identifier)
-        )
-        user = cursor.fetchone()
+        user = conn.execute(SQL_SELECT_USER_BY_LOGIN, (identifier, identifier)).fetchone()
 
-        if user and check_password_hash(user['password_hash'], password):
-            cursor.execute(
-                "UPDATE users SET last_login=CURRENT_TIMESTAMP WHERE id=?",
-                (user['id'],)
-            )
-            conn.commit()
-            conn.close()
+        if user and verify_password(user['password_hash'], password):
+            queue_login(user['id'])
+            if needs_rehash(user['password_hash']):
+                conn.execute(SQL_UPDATE_PASSWORD_HASH, (hash_password(password), user['id']))
 
             session['user_id'] = user['id']
             session['username'] = user['username']
             return redirect(url_for('dashboard'))
 
-        conn.close()
         flash("Invalid credentials", "error")
 
-    return render_template('login.html')
+    return render_cached('login.html')
 
 @app.route('/logout')
 def logout():
@@ -142,55 +663,38 @@ def logout():
 # Dashboard
 # =====================================================
 @app.route('/dashboard')
+@require_auth
 def dashboard():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
     return render_template('dashboard.html')
 
 # =====================================================
 # Profile Page
 # =====================================================
 @app.route('/profile')
+@require_auth
 def profile():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-
+    flush_before_read()
     conn = get_db()
-    cursor = conn.cursor()
 
-    # User info
-    cursor.execute("""
-        SELECT username, email, created_at, last_login
-        FROM users WHERE id=?
-    """, (session['user_id'],))
-    user = cursor.fetchone()
-
-    # Energy stats
-    cursor.execute("""
-        SELECT COUNT(*) AS steps, COALESCE(SUM(energy_generated),0) AS energy
-        FROM energy_data WHERE user_id=?
-    """, (session['user_id'],))
-    stats = cursor.fetchone()
-    conn.close()
+    # User info and energy stats
+    user = conn.execute(SQL_SELECT_PROFILE, (g.uid,)).fetchone()
 
     return render_template(
         'profile.html',
         username=user['username'],
         email=user['email'],
-        created_at=user['created_at'].split(" ")[0],
+        created_at=user['created_on'],
         last_login=user['last_login'] or "Never",
-        total_steps=stats['steps'],
-        total_energy=round(stats['energy'] * 1000, 2)
+        total_steps=user['total_steps'],
+        total_energy=round(user['total_energy'] * 1000, 2)
     )
 
 # =====================================================
 # Update Profile (FIXED)
 # =====================================================
 @app.route('/update-profile', methods=['POST'])
+@require_auth
 def update_profile():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-
     username = request.form.get('username').strip()
     email = request.form.get('email').strip().lower()
 
@@ -199,25 +703,15 @@ def update_profile():
         return redirect(url_for('profile'))
 
     conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT id FROM users
-        WHERE (username=? OR email=?) AND id!=?
-    """, (username, email, session['user_id']))
 
-    if cursor.fetchone():
-        conn.close()
-        flash("Username or email already in use", "error")
+    # The UNIQUE constraints reject a name or email held by another user.
+    try:
+        conn.execute(SQL_UPDATE_PROFILE, (username, email, g.uid))
+    except sqlite3.IntegrityError as e:
+        taken = "Email" if "users.email" in str(e) else "Username"
+        flash(f"{taken} already in use", "error")
         return redirect(url_for('profile'))
 
-    cursor.execute("""
-        UPDATE users SET username=?, email=? WHERE id=?
-    """, (username, email, session['user_id']))
-
-    conn.commit()
-    conn.close()
-
     session['username'] = username
     flash("Profile updated successfully", "success")
     return redirect(url_for('profile'))
@@ -226,32 +720,15 @@ def update_profile():
 # Energy Simulation
 # =====================================================
 @app.route('/simulate-step', methods=['POST'])
+@require_api_auth
 def simulate_step():
-    if 'user_id' not in session:
-        return jsonify({'success': False}), 401
-
-    force = random.uniform(400, 800)
-    displacement = random.uniform(0.002, 0.005)
-    energy_j = force * displacement
-
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT COALESCE(MAX(footsteps),0) FROM energy_data WHERE user_id=?",
-        (session['user_id'],)
-    )
-    step = cursor.fetchone()[0] + 1
+    force, displacement, energy_j = draw_sample()
 
-    cursor.execute("""
-        INSERT INTO energy_data (user_id, footsteps, force, displacement, energy_generated)
-        VALUES (?, ?, ?, ?, ?)
-    """, (session['user_id'], step, force, displacement, energy_j))
+    step = queue_step(get_db(), g.uid, force, displacement, energy_j)
+    if step is None:
+        return json_response({'success': False}, 401)
 
-    conn.commit()
-    conn.close()
-
-    return jsonify({
+    return json_response({
         "success": True,
         "step": step,
         "energy_mj": round(energy_j * 1000, 2)
@@ -261,63 +738,67 @@ def simulate_step():
 # Dashboard Data
 # =====================================================
 @app.route('/get-energy-data')
+@require_api_auth
 def get_energy_data():
-    if 'user_id' not in session:
-        return jsonify({'success': False}), 401
+    key = (g.uid, _user_version.get(g.uid, 0))
+    with _energy_cache_lock:
+        payload = _energy_cache.get(key)
+    if payload is not None:
+        return json_response(payload)
 
+    flush_before_read()
     conn = get_db()
+
+    # Plain tuples: the payload is built positionally, so skip sqlite3.Row
     cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(SQL_SELECT_RECENT_STEPS, (g.uid,)).fetchall()
+    total_steps, total_energy = rows[0][4:] if rows else (0, 0)
 
-    cursor.execute("""
-        SELECT footsteps, force, displacement, energy_generated
-        FROM energy_data
-        WHERE user_id=?
-        ORDER BY footsteps DESC
-        LIMIT 10
-    """, (session['user_id'],))
-    rows = cursor.fetchall()
-
-    cursor.execute("""
-        SELECT COUNT(*), COALESCE(SUM(energy_generated),0)
-        FROM energy_data WHERE user_id=?
-    """, (session['user_id'],))
-    total_steps, total_energy = cursor.fetchone()
-    conn.close()
+    energy_mj = total_energy * 1000
+    energy_wh = energy_mj / 3_600_000
 
-    return jsonify({
+    payload = {
         "success": True,
         "statistics": {
             "total_steps": total_steps,
-            "total_energy_mj": round(total_energy * 1000, 2),
-            "total_energy_wh": round((total_energy * 1000) / 3_600_000, 6),
-            "avg_energy": round((total_energy * 1000) / total_steps, 2) if total_steps else 0,
-            "energy_value_inr": round(((total_energy * 1000) / 3_600_000) * 8, 2)
+            "total_energy_mj": round(energy_mj, 2),
+            "total_energy_wh": round(energy_wh, 6),
+            "avg_energy": round(energy_mj / total_steps, 2) if total_steps else 0,
+            "energy_value_inr": round(energy_wh * 8, 2)
         },
         "recent_records": [
-            {
-                "step": r["footsteps"],
-                "force": round(r["force"], 2),
-                "displacement": round(r["displacement"] * 1000, 3),
-                "energy": round(r["energy_generated"] * 1000, 2)
-            } for r in rows
+            {"step": r[0], "force": r[1], "displacement": r[2], "energy": r[3]}
+            for r in rows
         ]
-    })
+    }
+    with _energy_cache_lock:
+        _energy_cache[key] = payload
+    return json_response(payload)
 
 # =====================================================
 # Clear Data
 # =====================================================
 @app.route('/clear-data', methods=['POST'])
+@require_api_auth
 def clear_data():
-    if 'user_id' not in session:
-        return jsonify({'success': False}), 401
-
+    user_id = g.uid
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM energy_data WHERE user_id=?", (session['user_id'],))
-    conn.commit()
-    conn.close()
 
-    return jsonify({"success": True})
+    # Committed steps fall at or below the new clear_cutoff and are hidden
+    # from reads at once, then swept. Steps still buffered, in this worker or
+    # any other, carry the old clear_epoch and are discarded when their batch
+    # is written.
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(SQL_DELETE_STATS, (user_id,))
+    conn.execute(SQL_RESET_STEP_COUNT, (user_id,))
+    conn.execute("COMMIT")
+    _bump_version(user_id)
+
+    sweep_cleared(conn, user_id)
+    _bump_version(user_id)
+
+    return json_response({"success": True})
 
 # =====================================================
 # Run
@@ -1,26 +1,25 @@
+"""Application configuration, read from the environment once at import"""
+
 import os
 
-class Config:
-    """Application configuration"""
-    
-    # Flask
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    
-    # Database
-    DATABASE = os.environ.get('DATABASE_PATH') or 'smart_tiles.db'
-    
-    # Email Configuration
-    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
-    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
-    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
-    MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL', 'false').lower() in ['true', 'on', '1']
-    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
-    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
-    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@smarttile.com'
-    
-    # Application
-    APP_NAME = 'Smart Tile Energy Harvesting System'
-    SUPPORT_EMAIL = 'support@smarttile.com'
-    
-    # Password Reset
-    RESET_TOKEN_EXPIRY_HOURS = 1
\ No newline at end of file
+# Flask
+SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+
+# Database
+DATABASE = os.environ.get('DATABASE_PATH') or 'smart_tiles.db'
+
+# Email Configuration
+MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
+MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
+MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
+MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL', 'false').lower() in ['true', 'on', '1']
+MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@smarttile.com'
+
+# Application
+APP_NAME = 'Smart Tile Energy Harvesting System'
+SUPPORT_EMAIL = 'support@smarttile.com'
+
+# Password Reset
+RESET_TOKEN_EXPIRY_HOURS = 1
\ No newline at end of file
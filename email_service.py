@@ -1,150 +1,51 @@
+import atexit
 import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from config import Config
+from jinja2 import Environment
+from config import (
+    APP_NAME,
+    MAIL_DEFAULT_SENDER,
+    MAIL_PASSWORD,
+    MAIL_PORT,
+    MAIL_SERVER,
+    MAIL_USERNAME,
+    MAIL_USE_SSL,
+    MAIL_USE_TLS,
+    RESET_TOKEN_EXPIRY_HOURS,
+    SUPPORT_EMAIL
+)
 
-class EmailService:
-    """Email sending service"""
-    
-    def __init__(self):
-        self.config = Config()
-    
-    def send_email(self, to_email, subject, html_body, text_body=None):
-        """
-        Send email using SMTP
-        
-        Args:
-            to_email: Recipient email address
-            subject: Email subject
-            html_body: HTML content of email
-            text_body: Plain text fallback (optional)
-        
-        Returns:
-            bool: True if sent successfully, False otherwise
-        """
-        try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.config.MAIL_DEFAULT_SENDER
-            msg['To'] = to_email
-            
-            # Add plain text version
-            if text_body:
-                part1 = MIMEText(text_body, 'plain')
-                msg.attach(part1)
-            
-            # Add HTML version
-            part2 = MIMEText(html_body, 'html')
-            msg.attach(part2)
-            
-            # Check if email is configured
-            if not self.config.MAIL_USERNAME or not self.config.MAIL_PASSWORD:
-                print("\n" + "="*70)
-                print("⚠️  EMAIL SERVICE NOT CONFIGURED")
-                print("="*70)
-                print("📧 MOCK EMAIL (Development Mode)")
-                print("-"*70)
-                print(f"To: {to_email}")
-                print(f"From: {self.config.MAIL_DEFAULT_SENDER}")
-                print(f"Subject: {subject}")
-                print("-"*70)
-                print("\n" + (text_body or "See HTML version in production"))
-                print("\n" + "="*70)
-                print("💡 To enable real emails:")
-                print("   1. Create .env file from .env.example")
-                print("   2. Add your SMTP credentials")
-                print("   3. See EMAIL_SETUP.md for detailed instructions")
-                print("="*70 + "\n")
-                return True
-            
-            # Send email via SMTP
-            print(f"📤 Sending email to {to_email}...")
-            
-            if self.config.MAIL_USE_SSL:
-                server = smtplib.SMTP_SSL(self.config.MAIL_SERVER, self.config.MAIL_PORT)
-            else:
-                server = smtplib.SMTP(self.config.MAIL_SERVER, self.config.MAIL_PORT)
-                if self.config.MAIL_USE_TLS:
-                    server.starttls()
-            
-            server.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
-            server.send_message(msg)
-            server.quit()
-            
-            print(f"✅ Email sent successfully to {to_email}\n")
-            return True
-            
-        except Exception as e:
-            print(f"\n❌ Failed to send email: {str(e)}")
-            print("\n" + "="*70)
-            print("📧 EMAIL MOCK (Fallback - SMTP Failed)")
-            print("="*70)
-            print(f"To: {to_email}")
-            print(f"Subject: {subject}")
-            print("-"*70)
-            print(text_body or "See HTML version")
-            print("="*70 + "\n")
-            return False
-    
-    def send_password_reset_email(self, to_email, reset_link, username=None):
-        """
-        Send password reset email
-        
-        Args:
-            to_email: User's email address
-            reset_link: Password reset URL
-            username: User's username (optional)
-        
-        Returns:
-            bool: True if sent successfully
-        """
-        subject = f"{self.config.APP_NAME} - Password Reset Request"
-        
-        # Plain text version
-        text_body = f"""
-Hello {username or 'User'},
-
-You requested to reset your password for {self.config.APP_NAME}.
-
-Click the link below to reset your password:
-{reset_link}
-
-This link will expire in {self.config.RESET_TOKEN_EXPIRY_HOURS} hour(s).
-
-If you did not request this password reset, please ignore this email.
-
-Best regards,
-{self.config.APP_NAME} Team
-        """.strip()
-        
-        # HTML version
-        html_body = f"""
+# HTML bodies are compiled once at import; autoescape keeps user-supplied
+# values such as the username from being rendered as markup.
+RESET_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
     <style>
-        body {{
+        body {
             font-family: Arial, sans-serif;
             line-height: 1.6;
             color: #333;
             max-width: 600px;
             margin: 0 auto;
             padding: 20px;
-        }}
-        .header {{
+        }
+        .header {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
             padding: 30px;
             text-align: center;
             border-radius: 10px 10px 0 0;
-        }}
-        .content {{
+        }
+        .content {
             background: #f9f9f9;
             padding: 30px;
             border: 1px solid #ddd;
-        }}
-        .button {{
+        }
+        .button {
             display: inline-block;
             padding: 15px 30px;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -153,21 +54,21 @@ Best regards,
             border-radius: 8px;
             margin: 20px 0;
             font-weight: bold;
-        }}
-        .footer {{
+        }
+        .footer {
             background: #f1f1f1;
             padding: 20px;
             text-align: center;
             font-size: 12px;
             color: #666;
             border-radius: 0 0 10px 10px;
-        }}
-        .warning {{
+        }
+        .warning {
             background: #fff3cd;
             border-left: 4px solid #ffc107;
             padding: 15px;
             margin: 20px 0;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -176,109 +77,79 @@ Best regards,
     </div>
     
     <div class="content">
-        <p>Hello <strong>{username or 'User'}</strong>,</p>
+        <p>Hello <strong>{{ username or 'User' }}</strong>,</p>
         
-        <p>You requested to reset your password for <strong>{self.config.APP_NAME}</strong>.</p>
+        <p>You requested to reset your password for <strong>{{ app_name }}</strong>.</p>
         
         <p>Click the button below to reset your password:</p>
         
         <center>
-            <a href="{reset_link}" class="button">Reset Password</a>
+            <a href="{{ reset_link }}" class="button">Reset Password</a>
         </center>
         
         <p style="font-size: 12px; color: #666;">
             Or copy and paste this link into your browser:<br>
-            <a href="{reset_link}">{reset_link}</a>
+            <a href="{{ reset_link }}">{{ reset_link }}</a>
         </p>
         
         <div class="warning">
-            <strong>⚠️ Important:</strong> This link will expire in {self.config.RESET_TOKEN_EXPIRY_HOURS} hour(s).
+            <strong>⚠️ Important:</strong> This link will expire in {{ expiry_hours }} hour(s).
         </div>
         
         <p style="margin-top: 30px;">If you did not request this password reset, please ignore this email and your password will remain unchanged.</p>
         
         <p>Best regards,<br>
-        <strong>{self.config.APP_NAME} Team</strong></p>
+        <strong>{{ app_name }} Team</strong></p>
     </div>
     
     <div class="footer">
         <p>This is an automated email. Please do not reply.</p>
-        <p>For support, contact: {self.config.SUPPORT_EMAIL}</p>
+        <p>For support, contact: {{ support_email }}</p>
     </div>
 </body>
 </html>
-        """.strip()
-        
-        return self.send_email(to_email, subject, html_body, text_body)
-    
-    def send_welcome_email(self, to_email, username):
-        """
-        Send welcome email to new users
-        
-        Args:
-            to_email: User's email address
-            username: User's username
-        
-        Returns:
-            bool: True if sent successfully
-        """
-        subject = f"Welcome to {self.config.APP_NAME}!"
-        
-        text_body = f"""
-Hello {username},
-
-Welcome to {self.config.APP_NAME}!
-
-Your account has been successfully created. You can now log in and start monitoring your piezoelectric tile energy production.
-
-Dashboard: http://localhost:5000/dashboard
-
-Thank you for joining us in the journey towards sustainable energy!
+"""
 
-Best regards,
-{self.config.APP_NAME} Team
-        """.strip()
-        
-        html_body = f"""
+WELCOME_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
     <style>
-        body {{
+        body {
             font-family: Arial, sans-serif;
             line-height: 1.6;
             color: #333;
             max-width: 600px;
             margin: 0 auto;
             padding: 20px;
-        }}
-        .header {{
+        }
+        .header {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
             padding: 30px;
             text-align: center;
             border-radius: 10px 10px 0 0;
-        }}
-        .content {{
+        }
+        .content {
             background: #f9f9f9;
             padding: 30px;
             border: 1px solid #ddd;
-        }}
-        .footer {{
+        }
+        .footer {
             background: #f1f1f1;
             padding: 20px;
             text-align: center;
             font-size: 12px;
             color: #666;
             border-radius: 0 0 10px 10px;
-        }}
-        .feature {{
+        }
+        .feature {
             background: white;
             padding: 15px;
             margin: 10px 0;
             border-left: 4px solid #667eea;
             border-radius: 4px;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -287,9 +158,9 @@ Best regards,
     </div>
     
     <div class="content">
-        <p>Hello <strong>{username}</strong>,</p>
+        <p>Hello <strong>{{ username }}</strong>,</p>
         
-        <p>Welcome to <strong>{self.config.APP_NAME}</strong>!</p>
+        <p>Welcome to <strong>{{ app_name }}</strong>!</p>
         
         <p>Your account has been successfully created. You can now monitor your piezoelectric tile energy production in real-time.</p>
         
@@ -318,14 +189,245 @@ Best regards,
         <p style="margin-top: 30px;">Thank you for joining us in the journey towards sustainable energy!</p>
         
         <p>Best regards,<br>
-        <strong>{self.config.APP_NAME} Team</strong></p>
+        <strong>{{ app_name }} Team</strong></p>
     </div>
     
     <div class="footer">
-        <p>For support, contact: {self.config.SUPPORT_EMAIL}</p>
+        <p>For support, contact: {{ support_email }}</p>
     </div>
 </body>
 </html>
+"""
+
+_templates = Environment(autoescape=True)
+_RESET_TEMPLATE = _templates.from_string(RESET_HTML.strip())
+_WELCOME_TEMPLATE = _templates.from_string(WELCOME_HTML.strip())
+
+# One SMTP session is shared so consecutive emails skip the TCP/TLS
+# handshake and AUTH; it is recycled after SMTP_MAX_MESSAGES.
+SMTP_MAX_MESSAGES = 100
+_smtp_conn = None
+_smtp_sent = 0
+_smtp_lock = threading.Lock()
+
+def _close_smtp():
+    # Called with _smtp_lock held
+    global _smtp_conn, _smtp_sent
+    if _smtp_conn is not None:
+        try:
+            _smtp_conn.quit()
+        except (smtplib.SMTPException, OSError):
+            _smtp_conn.close()
+    _smtp_conn = None
+    _smtp_sent = 0
+
+def _session_expired(error):
+    # Idle sessions end either with a dropped connection or a 421 reply
+    return (isinstance(error, smtplib.SMTPServerDisconnected)
+            or getattr(error, "smtp_code", None) == 421)
+
+def _shutdown_smtp():
+    with _smtp_lock:
+        _close_smtp()
+
+atexit.register(_shutdown_smtp)
+
+# Sends go through the one shared session above, so a single background
+# thread keeps requests off the SMTP round trips without queuing on the lock.
+_email_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email")
+atexit.register(_email_pool.shutdown)
+
+class EmailService:
+    """Email sending service"""
+    
+    def send_email(self, to_email, subject, html_body, text_body=None):
+        """
+        Send email using SMTP
+        
+        Args:
+            to_email: Recipient email address
+            subject: Email subject
+            html_body: HTML content of email
+            text_body: Plain text fallback (optional)
+        
+        Returns:
+            bool: True if sent successfully, False otherwise
+        """
+        # Check if email is configured
+        if not MAIL_USERNAME or not MAIL_PASSWORD:
+            print("\n" + "="*70)
+            print("⚠️  EMAIL SERVICE NOT CONFIGURED")
+            print("="*70)
+            print("📧 MOCK EMAIL (Development Mode)")
+            print("-"*70)
+            print(f"To: {to_email}")
+            print(f"From: {MAIL_DEFAULT_SENDER}")
+            print(f"Subject: {subject}")
+            print("-"*70)
+            print("\n" + (text_body or "See HTML version in production"))
+            print("\n" + "="*70)
+            print("💡 To enable real emails:")
+            print("   1. Create .env file from .env.example")
+            print("   2. Add your SMTP credentials")
+            print("   3. See EMAIL_SETUP.md for detailed instructions")
+            print("="*70 + "\n")
+            return True
+        
+        try:
+            # Create message
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = subject
+            msg['From'] = MAIL_DEFAULT_SENDER
+            msg['To'] = to_email
+            
+            # Add plain text version
+            if text_body:
+                part1 = MIMEText(text_body, 'plain')
+                msg.attach(part1)
+            
+            # Add HTML version
+            part2 = MIMEText(html_body, 'html')
+            msg.attach(part2)
+            
+            # Send email via SMTP
+            print(f"📤 Sending email to {to_email}...")
+            self._deliver(msg)
+            
+            print(f"✅ Email sent successfully to {to_email}\n")
+            return True
+            
+        except Exception as e:
+            print(f"\n❌ Failed to send email: {str(e)}")
+            print("\n" + "="*70)
+            print("📧 EMAIL MOCK (Fallback - SMTP Failed)")
+            print("="*70)
+            print(f"To: {to_email}")
+            print(f"Subject: {subject}")
+            print("-"*70)
+            print(text_body or "See HTML version")
+            print("="*70 + "\n")
+            return False
+    
+    def send_email_async(self, to_email, subject, html_body, text_body=None):
+        """
+        Queue an email for the background sender and return immediately
+        
+        Returns:
+            Future: resolves to send_email's result
+        """
+        return _email_pool.submit(self.send_email, to_email, subject, html_body, text_body)
+    
+    def _connect_smtp(self):
+        """Open and authenticate a new SMTP session"""
+        if MAIL_USE_SSL:
+            server = smtplib.SMTP_SSL(MAIL_SERVER, MAIL_PORT)
+        else:
+            server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT)
+            if MAIL_USE_TLS:
+                server.starttls()
+        
+        server.login(MAIL_USERNAME, MAIL_PASSWORD)
+        return server
+    
+    def _deliver(self, msg):
+        """Send a message over the shared SMTP session"""
+        global _smtp_conn, _smtp_sent
+        with _smtp_lock:
+            if _smtp_sent >= SMTP_MAX_MESSAGES:
+                _close_smtp()
+            try:
+                if _smtp_conn is None:
+                    _smtp_conn = self._connect_smtp()
+                    _smtp_conn.send_message(msg)
+                else:
+                    try:
+                        _smtp_conn.send_message(msg)
+                    except smtplib.SMTPException as e:
+                        if not _session_expired(e):
+                            raise
+                        # The server dropped the idle session; retry once on a new one
+                        _close_smtp()
+                        _smtp_conn = self._connect_smtp()
+                        _smtp_conn.send_message(msg)
+            except Exception:
+                _close_smtp()
+                raise
+            _smtp_sent += 1
+    
+    def send_password_reset_email(self, to_email, reset_link, username=None):
+        """
+        Send password reset email
+        
+        Args:
+            to_email: User's email address
+            reset_link: Password reset URL
+            username: User's username (optional)
+        
+        Returns:
+            bool: True if sent successfully
+        """
+        subject = f"{APP_NAME} - Password Reset Request"
+        
+        # Plain text version
+        text_body = f"""
+Hello {username or 'User'},
+
+You requested to reset your password for {APP_NAME}.
+
+Click the link below to reset your password:
+{reset_link}
+
+This link will expire in {RESET_TOKEN_EXPIRY_HOURS} hour(s).
+
+If you did not request this password reset, please ignore this email.
+
+Best regards,
+{APP_NAME} Team
         """.strip()
         
+        # HTML version
+        html_body = _RESET_TEMPLATE.render(
+            username=username,
+            reset_link=reset_link,
+            app_name=APP_NAME,
+            expiry_hours=RESET_TOKEN_EXPIRY_HOURS,
+            support_email=SUPPORT_EMAIL
+        )
+        
+        return self.send_email(to_email, subject, html_body, text_body)
+    
+    def send_welcome_email(self, to_email, username):
+        """
+        Send welcome email to new users
+        
+        Args:
+            to_email: User's email address
+            username: User's username
+        
+        Returns:
+            bool: True if sent successfully
+        """
+        subject = f"Welcome to {APP_NAME}!"
+        
+        text_body = f"""
+Hello {username},
+
+Welcome to {APP_NAME}!
+
+Your account has been successfully created. You can now log in and start monitoring your piezoelectric tile energy production.
+
+Dashboard: http://localhost:5000/dashboard
+
+Thank you for joining us in the journey towards sustainable energy!
+
+Best regards,
+{APP_NAME} Team
+        """.strip()
+        
+        html_body = _WELCOME_TEMPLATE.render(
+            username=username,
+            app_name=APP_NAME,
+            support_email=SUPPORT_EMAIL
+        )
+        
         return self.send_email(to_email, subject, html_body, text_body)
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for production
+Picked up automatically by: gunicorn app:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Separate processes sidestep the GIL; SQLite in WAL mode lets them read
+# concurrently while writes are serialized by the database lock. The count
+# is capped because each worker keeps its own pool of up to DB_POOL_SIZE
+# connections, each with a 20 MB page cache.
+#
+# Each worker also has its own footstep write buffer and /get-energy-data
+# cache, so a dashboard poll served by a different worker than the one that
+# took a step can lag by up to FLUSH_INTERVAL plus the 1 s cache TTL.
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
@@ -7,6 +7,7 @@ Run this to fix database issues and start fresh
 import os
 import sqlite3
 import sys
+import traceback
 from datetime import datetime
 
 DATABASE = 'smart_tiles.db'
@@ -43,33 +44,63 @@ def create_fresh_database():
         conn = sqlite3.connect(DATABASE)
         cursor = conn.cursor()
         
-        # Create users table
-        print("📝 Creating users table...")
-        cursor.execute('''
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP
-            )
-        ''')
-        
-        # Create password_reset_tokens table
-        print("📝 Creating password_reset_tokens table...")
-        cursor.execute('''
-            CREATE TABLE password_reset_tokens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL,
-                token TEXT UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL,
-                used BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        conn.commit()
+        # One transaction for the whole schema: sqlite3 doesn't open one
+        # for DDL by itself, so each CREATE would otherwise commit alone
+        with conn:
+            cursor.execute("BEGIN")
+            
+            # Create users table
+            print("📝 Creating users table...")
+            cursor.execute('''
+                CREATE TABLE users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    email TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_login TIMESTAMP,
+                    step_count INTEGER NOT NULL DEFAULT 0,
+                    clear_epoch INTEGER NOT NULL DEFAULT 0,
+                    clear_cutoff INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            # Create energy_data table
+            print("📝 Creating energy_data table...")
+            cursor.execute('''
+                CREATE TABLE energy_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    footsteps INTEGER NOT NULL,
+                    force REAL NOT NULL,
+                    displacement REAL NOT NULL,
+                    energy_generated REAL NOT NULL
+                )
+            ''')
+            
+            # Serves the per-user recent-steps listing as an index range scan
+            cursor.execute('''
+                CREATE INDEX idx_energy_user_step ON energy_data(user_id, footsteps DESC)
+            ''')
+            
+            # Create password_reset_tokens table
+            print("📝 Creating password_reset_tokens table...")
+            cursor.execute('''
+                CREATE TABLE password_reset_tokens (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT NOT NULL,
+                    token TEXT UNIQUE NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP NOT NULL,
+                    used BOOLEAN DEFAULT 0
+                )
+            ''')
+            
+            # Lets expired tokens be purged without scanning the whole table
+            cursor.execute('''
+                CREATE INDEX idx_reset_expires ON password_reset_tokens(expires_at)
+            ''')
         
         # Verify tables
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -102,7 +133,6 @@ def create_fresh_database():
         
     except Exception as e:
         print(f"\n❌ Error creating database: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
@@ -35,9 +35,14 @@ echo "   ✅ Login successful"
 echo "   📧 PASSWORD RESET LINK"
 echo ""
 echo "========================================================================"
-echo "Starting Flask server..."
+echo "Starting server..."
 echo "========================================================================"
 echo ""
 
-# Start Flask
-python3 app.py
\ No newline at end of file
+# Serve with gunicorn (settings in gunicorn.conf.py) so requests run in
+# several worker processes; fall back to the Flask server without it.
+if command -v gunicorn > /dev/null 2>&1; then
+    PYTHONUNBUFFERED=1 gunicorn app:app
+else
+    python3 app.py
+fi
\ No newline at end of file
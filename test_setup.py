@@ -93,6 +93,10 @@ def check_dependencies():
         'flask': 'Flask',
         'flask_cors': 'Flask-CORS',
         'werkzeug': 'Werkzeug',
+        'argon2': 'argon2-cffi',
+        'numpy': 'NumPy',
+        'orjson': 'orjson',
+        'cachetools': 'cachetools',
         'dotenv': 'python-dotenv'
     }
     